@@ -1,19 +1,72 @@
+import asyncio
 import hashlib
 import time
 import difflib
 import datetime
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
 import threading
 import random
 import string
 import os
+import io
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from decouple import config
 
+try:
+    from blake3 import blake3
+
+    def content_hash(data=b''):
+        """Create a BLAKE3 hasher that spreads large inputs over its own worker threads."""
+        return blake3(data, max_threads=blake3.AUTO)
+except ImportError:
+    # Fall back to SHA-256, which is hardware accelerated (SHA-NI) on most modern CPUs
+    content_hash = hashlib.sha256
+
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
 # Load Telegram bot token and chat ID from environment variables or .env file
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = config('TELEGRAM_CHAT_ID')
 
+# Maximum number of URL checks running at once; also the size of the HTTP connection pool
+URL_WORKERS = 64
+
+# Shared HTTP session so polls and Telegram calls reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=URL_WORKERS, pool_maxsize=URL_WORKERS))
+SESSION.mount('https://', HTTPAdapter(pool_connections=URL_WORKERS, pool_maxsize=URL_WORKERS))
+SESSION.headers['User-Agent'] = 'wchanged/1.0'
+
+# Guards appends to the shared log file across monitor threads
+_LOG_LOCK = threading.Lock()
+
+# Change reports waiting to be sent to Telegram: identifier -> deque of report strings
+_pending_reports = {}
+_pending_lock = threading.Lock()
+_flush_event = threading.Event()
+
+# Send the pending reports early once a single file or URL has this many queued
+NOTIFY_MAX_PENDING = 20
+
+# Above this many lines (old + new) changes are found with a set comparison instead of difflib
+SET_DIFF_THRESHOLD = 10000
+
+# Validators and last result per URL for conditional GETs: url -> (etag, last_modified, hash, lines)
+_cond_cache = {}
+
+# Results younger than this many seconds are shared between monitors of the same URL
+RESPONSE_CACHE_TTL = 2.0
+
+# Recent results per URL: url -> (monotonic timestamp, hash, lines)
+_resp_cache = {}
+
 def send_telegram_message(message):
     """Send a simple text message to the Telegram bot."""
     url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
@@ -22,60 +75,160 @@ def send_telegram_message(message):
         'text': message
     }
     try:
-        response = requests.post(url, data=payload)
+        response = SESSION.post(url, data=payload)
         response.raise_for_status()
     except requests.RequestException as e:
         print(f"Failed to send message to Telegram: {e}")
 
-def send_telegram_document(document_path):
-    """Send a document to the Telegram bot and delete it after sending."""
+def send_telegram_document(document_name, document):
+    """Send an in-memory document (a binary file-like object) to the Telegram bot."""
     url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument'
-    with open(document_path, 'rb') as document:
-        files = {'document': document}
-        data = {'chat_id': TELEGRAM_CHAT_ID}
-        try:
-            response = requests.post(url, data=data, files=files)
-            response.raise_for_status()
-            print(f"Document sent to Telegram: {document_path}")
-        except requests.RequestException as e:
-            print(f"Failed to send document to Telegram: {e}")
-        finally:
-            # Delete the file after sending
-            os.remove(document_path)
-            print(f"Document deleted after sending: {document_path}")
-
-def get_file_hash(filename):
-    """Generate an MD5 hash for the contents of the given file."""
+    try:
+        if MultipartEncoder is not None:
+            # Stream the multipart body instead of building it in memory
+            encoder = MultipartEncoder(fields={
+                'chat_id': TELEGRAM_CHAT_ID,
+                'document': (document_name, document, 'text/plain'),
+            })
+            response = SESSION.post(url, data=encoder, headers={'Content-Type': encoder.content_type})
+        else:
+            files = {'document': (document_name, document)}
+            data = {'chat_id': TELEGRAM_CHAT_ID}
+            response = SESSION.post(url, data=data, files=files)
+        response.raise_for_status()
+        print(f"Document sent to Telegram: {document_name}")
+    except requests.RequestException as e:
+        print(f"Failed to send document to Telegram: {e}")
+
+def read_and_hash(filename):
+    """Read the given file and return its BLAKE3 (or SHA-256) hash together with the raw bytes."""
     try:
         with open(filename, 'rb') as f:
-            file_hash = hashlib.md5()
-            while chunk := f.read(8192):
-                file_hash.update(chunk)
-            return file_hash.hexdigest()
+            data = f.read()
     except FileNotFoundError:
+        return None, None
+    # Hash the whole file in one call over a single contiguous buffer. Unlike a memory
+    # map, this buffer cannot fault (SIGBUS) when the watched file is truncated meanwhile.
+    return content_hash(data).digest(), data
+
+def get_file_signature(filename):
+    """Return the modification time and size of the given file, or None if it cannot be read."""
+    try:
+        st = os.stat(filename)
+    except OSError:
         return None
+    return st.st_mtime_ns, st.st_size
+
+def get_url_hash(url, max_age=RESPONSE_CACHE_TTL):
+    """Generate a BLAKE3 (or SHA-256) hash for the contents of the file at the given URL.
+
+    Uses a conditional GET (If-None-Match / If-Modified-Since) so that an
+    unchanged resource answered with 304 reuses the cached hash and lines.
+    Results fetched less than max_age seconds ago are returned without any
+    request; pass max_age=0 to always go to the network.
+    """
+    cached = _resp_cache.get(url)
+    if cached is not None and time.monotonic() - cached[0] < max_age:
+        return cached[1], cached[2]
 
-def get_url_hash(url):
-    """Generate an MD5 hash for the contents of the file at the given URL."""
+    etag, last_modified, cached_hash, cached_lines = _cond_cache.get(url, (None, None, None, None))
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return hashlib.md5(response.content).hexdigest(), response.text.splitlines()
+        with SESSION.get(url, headers=headers, timeout=10, stream=True) as response:
+            if response.status_code == 304 and cached_hash is not None:
+                _resp_cache[url] = (time.monotonic(), cached_hash, cached_lines)
+                return cached_hash, cached_lines
+            response.raise_for_status()
+            # Hash the body while streaming it instead of materializing response.content;
+            # large chunks let the hasher work outside the GIL
+            url_hash = content_hash()
+            body = bytearray()
+            for chunk in response.iter_content(1 << 20):
+                url_hash.update(chunk)
+                body += chunk
+            url_hash = url_hash.digest()
+            # Decode the buffer in place; response.apparent_encoding would need response.content,
+            # which is gone after streaming, so run requests' charset detector on it directly
+            encoding = response.encoding
+            if encoding is None and chardet is not None:
+                encoding = chardet.detect(body)['encoding']
+            try:
+                text = body.decode(encoding or 'utf-8', 'replace')
+            except LookupError:
+                # Unknown charset from the server, same fallback as Response.text
+                text = body.decode('utf-8', 'replace')
+            del body
+            lines = text.splitlines()
+            _cond_cache[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'), url_hash, lines)
+            _resp_cache[url] = (time.monotonic(), url_hash, lines)
+            return url_hash, lines
     except requests.RequestException:
         return None, None
 
-def read_file_content(filename):
-    """Read the contents of the file and return as a list of lines."""
+def get_url_validators(url):
+    """Return the ETag, Last-Modified and Content-Length of the given URL using a HEAD request.
+
+    Returns None when the request fails or the server sends neither an ETag nor
+    a Last-Modified header. Content-Length alone cannot prove that the content
+    is unchanged, so it only serves as an extra signal that it has changed.
+    """
     try:
-        with open(filename, 'r') as f:
-            return f.readlines()
-    except FileNotFoundError:
+        response = SESSION.head(url, timeout=5, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException:
         return None
+    validators = (
+        response.headers.get('ETag'),
+        response.headers.get('Last-Modified'),
+        response.headers.get('Content-Length'),
+    )
+    return validators if validators[0] or validators[1] else None
 
-def log_changes(log_filename, identifier, changes):
-    """Log the changes to a log file and send them to Telegram as a document."""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    
+def decode_lines(data):
+    """Decode raw file contents into a list of lines, splitting on universal newlines only."""
+    return io.StringIO(data.decode('utf-8', 'replace'), newline=None).readlines()
+
+def diff_lines(previous_content, current_content):
+    """Return the removed and added lines as (line_num, line_content, change_type) tuples.
+
+    Large inputs are first compared as multisets of lines in linear time, which
+    reports lines whose count differs between the versions. If that finds
+    nothing (e.g. lines were only moved), difflib is used instead.
+    """
+    if len(previous_content) + len(current_content) > SET_DIFF_THRESHOLD:
+        previous_counts = collections.Counter(previous_content)
+        current_counts = collections.Counter(current_content)
+        removed = previous_counts - current_counts
+        added = current_counts - previous_counts
+        changes = []
+        for k, line in enumerate(previous_content):
+            if removed[line] > 0:
+                removed[line] -= 1
+                changes.append((k + 1, line.strip(), '[-]'))
+        for k, line in enumerate(current_content):
+            if added[line] > 0:
+                added[line] -= 1
+                changes.append((k + 1, line.strip(), '[+]'))
+        if changes:
+            return changes
+
+    matcher = difflib.SequenceMatcher(a=previous_content, b=current_content, autojunk=False)
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ('replace', 'delete'):
+            for k in range(i1, i2):
+                changes.append((k + 1, previous_content[k].strip(), '[-]'))
+        if tag in ('replace', 'insert'):
+            for k in range(j1, j2):
+                changes.append((k + 1, current_content[k].strip(), '[+]'))
+    return changes
+
+def get_change_log_name(identifier, timestamp):
+    """Build the change log filename (domain+path+timestamp.txt) for the given file or URL."""
     # Parse domain and path for URLs, or use filename directly for files
     if identifier.startswith("http://") or identifier.startswith("https://"):
         # Extract domain and path from URL
@@ -87,30 +240,67 @@ def log_changes(log_filename, identifier, changes):
         path = identifier.replace("/", "_").replace(":", "_")
 
     # Combine into desired filename format: domain+path+timestamp.txt
-    change_log_path = f'{domain}{path}_{timestamp}.txt'
-    
-    # Write changes to log file and temporary change log
-    with open(log_filename, 'a') as log_file, open(change_log_path, 'w') as change_log_file:
+    return f'{domain}{path}_{timestamp}.txt'
+
+def log_changes(log_filename, identifier, changes):
+    """Log the changes to a log file and queue them for the next Telegram notification."""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    change_lines = [f'{change_type} line {line_num}: {line_content}\n' for line_num, line_content, change_type in changes]
+
+    # Append to the shared log file; monitors run concurrently, so serialize the writes
+    with _LOG_LOCK, open(log_filename, 'a') as log_file:
         log_file.write(f'[{timestamp}] {identifier} has been changed!\n')
-        
-        change_log_file.write(f'[{timestamp}] Changes in {identifier}:\n')
-        for line_num, line_content, change_type in changes:
-            log_file.write(f'{change_type} line {line_num}: {line_content}\n')
-            change_log_file.write(f'{change_type} line {line_num}: {line_content}\n')
+        log_file.writelines(change_lines)
         log_file.write('\n' + '-'*40 + '\n')
-        change_log_file.write('\n[!] Finished\n')
-    
-    # Send the change log file as a document to Telegram and delete it
-    send_telegram_document(change_log_path)
+
+    queue_report(identifier, f'[{timestamp}] Changes in {identifier}:\n' + ''.join(change_lines) + '\n')
+
+def queue_report(identifier, report):
+    """Queue a change report; reports are sent to Telegram in batches by the notifier thread."""
+    with _pending_lock:
+        reports = _pending_reports.setdefault(identifier, collections.deque())
+        reports.append(report)
+        if len(reports) >= NOTIFY_MAX_PENDING:
+            _flush_event.set()
+
+def flush_reports():
+    """Send all queued reports to Telegram as one change log document per file or URL."""
+    with _pending_lock:
+        pending = {identifier: list(reports) for identifier, reports in _pending_reports.items() if reports}
+        _pending_reports.clear()
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    for identifier, reports in pending.items():
+        # Build the change log in memory and upload it without touching the disk
+        change_log = io.BytesIO((''.join(reports) + '[!] Finished\n').encode())
+        send_telegram_document(get_change_log_name(identifier, timestamp), change_log)
+
+def notify_changes(interval):
+    """Flush queued reports every interval seconds, or sooner when a target has many pending."""
+    while True:
+        _flush_event.wait(interval)
+        _flush_event.clear()
+        try:
+            flush_reports()
+        except Exception as e:
+            # Keep the notifier alive so later reports are still sent
+            print(f"Failed to send change reports to Telegram: {e}")
 
 def analyze_file(filename, log_filename, interval):
     """Analyze the given file for changes."""
-    previous_hash = get_file_hash(filename)
-    previous_content = read_file_content(filename)
+    previous_signature = get_file_signature(filename)
+    # Keep the raw bytes; they are only decoded when a change needs to be diffed
+    previous_hash, previous_data = read_and_hash(filename)
 
     while True:
-        current_hash = get_file_hash(filename)
-        current_content = read_file_content(filename)
+        # Skip hashing when the modification time and size are unchanged
+        current_signature = get_file_signature(filename)
+        if current_signature == previous_signature:
+            time.sleep(interval)
+            continue
+        previous_signature = current_signature
+
+        current_hash, current_data = read_and_hash(filename)
         
         if current_hash != previous_hash:
             if current_hash is None:
@@ -118,33 +308,51 @@ def analyze_file(filename, log_filename, interval):
             else:
                 print(f'{filename} has been changed! LogFile -> {log_filename}')
 
-                if previous_content is not None and current_content is not None:
-                    diff = list(difflib.ndiff(previous_content, current_content))
-                    changes = []
-                    line_num = 0
-
-                    for line in diff:
-                        if line.startswith('+ '):
-                            changes.append((line_num + 1, line[2:].strip(), '[+]'))
-                        elif line.startswith('- '):
-                            changes.append((line_num + 1, line[2:].strip(), '[-]'))
-                        if not line.startswith('- '):
-                            line_num += 1
+                if previous_data is not None:
+                    changes = diff_lines(decode_lines(previous_data), decode_lines(current_data))
 
                     if changes:
                         log_changes(log_filename, filename, changes)
                     
-                previous_content = current_content
+                previous_data = current_data
             previous_hash = current_hash
             
         time.sleep(interval)
 
-def analyze_url(url, log_filename, interval):
+def url_cache_age(validators, interval):
+    """Return how old a shared get_url_hash result may be for a monitor polling every interval seconds.
+
+    When the HEAD pre-check returned validators, the fetch must reflect them, so
+    the shared cache is bypassed. Otherwise results from other monitors are
+    reused, but never the monitor's own result from its previous poll.
+    """
+    if validators is not None:
+        return 0
+    return min(RESPONSE_CACHE_TTL, interval / 2)
+
+async def analyze_url(url, log_filename, interval):
     """Analyze the file at the given URL for changes."""
-    previous_hash, previous_content = get_url_hash(url)
+    # Blocking HTTP and logging calls run in the loop's default executor
+    loop = asyncio.get_running_loop()
+    previous_validators = await loop.run_in_executor(None, get_url_validators, url)
+    previous_hash, previous_content = await loop.run_in_executor(
+        None, get_url_hash, url, url_cache_age(previous_validators, interval))
+    if previous_hash is None:
+        previous_validators = None
 
     while True:
-        current_hash, current_content = get_url_hash(url)
+        # Skip the download when the server reports the same validators as last time
+        current_validators = await loop.run_in_executor(None, get_url_validators, url)
+        if current_validators is not None and current_validators == previous_validators:
+            await asyncio.sleep(interval)
+            continue
+
+        current_hash, current_content = await loop.run_in_executor(
+            None, get_url_hash, url, url_cache_age(current_validators, interval))
+        # Only trust the new validators once the content behind them was fetched,
+        # otherwise a failed GET would make later HEADs skip the download for good
+        if current_hash is not None:
+            previous_validators = current_validators
         
         if current_hash != previous_hash:
             if current_hash is None:
@@ -153,31 +361,39 @@ def analyze_url(url, log_filename, interval):
                 print(f'{url} has been changed! LogFile -> {log_filename}')
 
                 if previous_content is not None and current_content is not None:
-                    diff = list(difflib.ndiff(previous_content, current_content))
-                    changes = []
-                    line_num = 0
-
-                    for line in diff:
-                        if line.startswith('+ '):
-                            changes.append((line_num + 1, line[2:].strip(), '[+]'))
-                        elif line.startswith('- '):
-                            changes.append((line_num + 1, line[2:].strip(), '[-]'))
-                        if not line.startswith('- '):
-                            line_num += 1
+                    changes = diff_lines(previous_content, current_content)
 
                     if changes:
-                        log_changes(log_filename, url, changes)
+                        await loop.run_in_executor(None, log_changes, log_filename, url, changes)
                     
                 previous_content = current_content
             previous_hash = current_hash
             
-        time.sleep(interval)
+        await asyncio.sleep(interval)
+
+async def keep_analyzing_url(url, log_filename, interval):
+    """Run analyze_url for the given URL, restarting it after an error so other URLs keep running."""
+    while True:
+        try:
+            await analyze_url(url, log_filename, interval)
+        except Exception as e:
+            print(f'Monitoring {url} failed, restarting: {e}')
+            await asyncio.sleep(interval)
+
+async def monitor_urls(urls, log_filename, interval):
+    """Monitor all URLs concurrently on a single event loop."""
+    # Blocking checks run on up to URL_WORKERS threads; beyond that they queue behind slow hosts
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=min(len(urls), URL_WORKERS)))
+    tasks = [asyncio.create_task(keep_analyzing_url(url, log_filename, interval)) for url in urls]
+    await asyncio.gather(*tasks)
 
 def main():
     parser = argparse.ArgumentParser(description="Monitor files and URLs for changes.")
     parser.add_argument('-c', '--config', type=str, required=True, help="Configuration file containing list of files or URLs to monitor.")
     parser.add_argument('-l', '--log', type=str, default='changes.log', help="Log file to save changes.")
     parser.add_argument('-t', '--interval', type=int, default=60, help="Default time interval between checks (in seconds).")
+    parser.add_argument('-n', '--notify-interval', type=int, default=None, help="Time interval between batched Telegram notifications (in seconds). Defaults to the check interval.")
     args = parser.parse_args()
 
     # Read configuration file
@@ -191,24 +407,38 @@ def main():
     # Strip whitespace from each line
     items_to_monitor = [line.strip() for line in items_to_monitor if line.strip()]
 
-    # Start monitoring each file or URL in a separate thread
+    # Send batched change reports to Telegram in the background; a window shorter than
+    # the check interval would never combine more than one report per target
+    notify_interval = args.notify_interval if args.notify_interval is not None else args.interval
+    notifier = threading.Thread(target=notify_changes, args=(notify_interval,), daemon=True)
+    notifier.start()
+
+    # Start monitoring each file in a separate thread; URLs share one event loop
     threads = []
+    urls = []
     for item in items_to_monitor:
         if item.startswith('http://') or item.startswith('https://'):
-            # If item is a URL, start a new thread to monitor it
+            # If item is a URL, schedule it on the event loop
             print(f"Monitoring URL: {item}")
-            thread = threading.Thread(target=analyze_url, args=(item, args.log, args.interval))
+            urls.append(item)
         else:
             # If item is a file path, start a new thread to monitor it
             print(f"Monitoring File: {item}")
             thread = threading.Thread(target=analyze_file, args=(item, args.log, args.interval))
-        
-        thread.start()
-        threads.append(thread)
+            thread.start()
+            threads.append(thread)
+
+    try:
+        # Run the URL monitors (they never return, as each monitoring loop runs indefinitely)
+        if urls:
+            asyncio.run(monitor_urls(urls, args.log, args.interval))
 
-    # Wait for all threads to complete (they won't, as each monitoring loop runs indefinitely)
-    for thread in threads:
-        thread.join()
+        # Wait for all threads to complete (they won't, as each monitoring loop runs indefinitely)
+        for thread in threads:
+            thread.join()
+    finally:
+        # Send whatever is still queued, e.g. on Ctrl-C
+        flush_reports()
 
 if __name__ == "__main__":
     main()